@@ -9,15 +9,28 @@ ceux qui ont été modifiés, et en supprimant ceux qui ont été supprimés cô
 
 import os
 import sys
+import atexit
+import logging
 import argparse
+import datetime
 from dotenv import load_dotenv
 
 # Import des modules du projet
 from src.exchange_service import ExchangeCalendarService
 from src.google_service import GoogleCalendarService
 from src.synchronizer import CalendarSynchronizer
+from src.journal import SyncJournal
+from src.quota import QuotaBudget
+from src.cassette import (
+    Cassette, RecordingExchangeService, RecordingGoogleService,
+    ReplayExchangeService, ReplayGoogleService
+)
 from src.utils.notification_utils import notify_error, format_exception
 from src.utils.healthchecks_utils import send_healthcheck_ping
+from src.utils.logging_utils import setup_logging, resolve_log_level
+from src.utils.profiling_utils import SyncProfiler, PROFILE_MODES, PROFILE_PHASES
+
+logger = logging.getLogger("exchange_sync")
 
 
 def main():
@@ -33,6 +46,15 @@ def main():
     timezone = os.getenv("TIMEZONE", "Europe/Paris")
     days_ahead = int(os.getenv("DAYS_AHEAD", "60"))
     enable_notifications = os.getenv("ENABLE_NOTIFICATIONS", "true").lower() == "true"
+    log_level = os.getenv("LOG_LEVEL", "info")
+    log_file = os.getenv("LOG_FILE")
+    log_json = os.getenv("LOG_JSON", "false").lower() == "true"
+    log_max_bytes = int(os.getenv("LOG_MAX_BYTES", "1000000"))
+    log_backup_count = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    journal_file = os.getenv("JOURNAL_FILE", "sync_journal.jsonl")
+    quota_per_run = int(os.getenv("QUOTA_PER_RUN", "0"))
+    quota_per_day = int(os.getenv("QUOTA_PER_DAY", "0"))
+    quota_state_file = os.getenv("QUOTA_STATE_FILE", "quota_state.json")
 
     # Analyse des arguments de ligne de commande
     parser = argparse.ArgumentParser(description="Synchronise Exchange vers Google Calendar.")
@@ -44,23 +66,69 @@ def main():
                        help="Désactive les notifications de bureau")
     parser.add_argument("--no-healthcheck", action="store_true",
                        help="Désactive les pings healthchecks.io")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                       help="Augmente la verbosité (détail des événements et des modifications)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                       help="N'affiche que les avertissements et les erreurs")
+    parser.add_argument("--log-json", action="store_true", default=log_json,
+                       help="Journalise au format JSON (une ligne par enregistrement)")
+    parser.add_argument("--log-file", default=log_file,
+                       help="Fichier de log avec rotation (défaut: sortie standard)")
+    parser.add_argument("--no-resume", action="store_true",
+                       help="Ignore le journal d'une exécution interrompue et resynchronise tout")
+    parser.add_argument("--quota-per-run", type=int, default=quota_per_run,
+                       help="Nombre maximal d'appels Google par exécution, 0 = illimité (défaut: %(default)s)")
+    parser.add_argument("--quota-per-day", type=int, default=quota_per_day,
+                       help="Nombre maximal d'appels Google par jour, 0 = illimité (défaut: %(default)s)")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="CASSETTE",
+                       help="Enregistre les échanges Exchange/Google (anonymisés) dans une cassette")
+    cassette_group.add_argument("--replay", metavar="CASSETTE",
+                       help="Rejoue une cassette hors ligne au lieu de contacter Exchange et Google")
+    parser.add_argument("--replay-latency", choices=["original", "zero"], default="original",
+                       help="Latence simulée lors du rejeu (défaut: original)")
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=PROFILE_MODES,
+                       help="Profile la synchronisation : cprofile (snakeviz) ou sampling (speedscope)")
+    parser.add_argument("--profile-output", metavar="PREFIXE",
+                       help="Préfixe des fichiers de profilage (défaut: profile-<date>)")
+    parser.add_argument("--profile-phases", metavar="PHASES",
+                       help=f"Limite le profilage à certaines phases ({','.join(PROFILE_PHASES)})")
 
     args = parser.parse_args()
 
+    if (args.profile_phases or args.profile_output) and not args.profile:
+        parser.error("--profile-phases et --profile-output nécessitent --profile")
+    profile_phases = [p.strip() for p in (args.profile_phases or "").split(",") if p.strip()]
+    if any(p not in PROFILE_PHASES for p in profile_phases):
+        parser.error(f"--profile-phases : phases possibles {', '.join(PROFILE_PHASES)}")
+
+    setup_logging(
+        level=resolve_log_level(log_level, args.verbose, args.quiet),
+        json_output=args.log_json,
+        log_file=args.log_file,
+        max_bytes=log_max_bytes,
+        backup_count=log_backup_count
+    )
+
     # Désactiver les notifications si demandé par argument
     if args.no_notify:
         enable_notifications = False
 
+    # Le rejeu d'une cassette est entièrement hors ligne
+    if args.replay:
+        enable_notifications = False
+        args.no_healthcheck = True
+
     # Envoyer un ping de début si healthchecks est activé
     if not args.no_healthcheck:
         send_healthcheck_ping("start")
 
     try:
         # Validation des variables d'environnement obligatoires
-        if not all([username, password, email, google_calendar_id]):
+        if not args.replay and not all([username, password, email, google_calendar_id]):
             error_msg = "Configuration incomplète dans le fichier .env"
-            print(f"❌ Erreur : {error_msg}")
-            print("!!!Veuillez définir EXCHANGE_USERNAME, EXCHANGE_EMAIL, EXCHANGE_PASSWORD et GOOGLE_CALENDAR_ID")
+            logger.error("❌ Erreur : %s", error_msg)
+            logger.error("!!!Veuillez définir EXCHANGE_USERNAME, EXCHANGE_EMAIL, EXCHANGE_PASSWORD et GOOGLE_CALENDAR_ID")
 
             if enable_notifications:
                 notify_error(error_msg)
@@ -70,12 +138,25 @@ def main():
 
             sys.exit(1)
 
+        cassette = None
+        if args.replay:
+            cassette = Cassette.load(args.replay)
+            logger.info("📼 Rejeu de la cassette %s (%d échanges)", args.replay, len(cassette.interactions))
+        elif args.record:
+            cassette = Cassette(args.record)
+            atexit.register(cassette.save)
+
         # Initialisation du service Exchange
-        exchange_service = ExchangeCalendarService(
-            username=username,
-            email=email,
-            password=password
-        )
+        if args.replay:
+            exchange_service = ReplayExchangeService(cassette, args.replay_latency)
+        else:
+            exchange_service = ExchangeCalendarService(
+                username=username,
+                email=email,
+                password=password
+            )
+            if args.record:
+                exchange_service = RecordingExchangeService(exchange_service, cassette)
 
         if not exchange_service.connect():
             error_msg = "Impossible de se connecter au serveur Exchange"
@@ -89,45 +170,91 @@ def main():
             sys.exit(1)
 
         # Connexion à Google Calendar
-        print("\n Connexion à Google Calendar...")
-        try:
-            google_service = GoogleCalendarService.authenticate()
-        except Exception as e:
-            error_msg = "Erreur d'authentification Google Calendar"
-            error_details = format_exception(e)
-            print(f"\n❌ {error_msg}")
-            print(f"\nDétails: {error_details}")
-            print("\nConseil: Supprimez le fichier token.json et réessayez pour vous authentifier à nouveau.")
+        if args.replay:
+            google_service = ReplayGoogleService(cassette, args.replay_latency)
+        else:
+            logger.info("🔗 Connexion à Google Calendar...")
+            try:
+                google_service = GoogleCalendarService.authenticate()
+            except Exception as e:
+                error_msg = "Erreur d'authentification Google Calendar"
+                error_details = format_exception(e)
+                logger.error("❌ %s", error_msg)
+                logger.error("Détails: %s", error_details)
+                logger.error("Conseil: Supprimez le fichier token.json et réessayez pour vous authentifier à nouveau.")
+
+                if enable_notifications:
+                    notify_error(error_msg, "Token expiré ou révoqué. Supprimez token.json et réessayez.")
+
+                if not args.no_healthcheck:
+                    send_healthcheck_ping("fail", f"{error_msg}\n\n{error_details}")
+
+                sys.exit(1)
+
+            if args.record:
+                google_service = RecordingGoogleService(google_service, cassette)
+
+        # Journal des modifications, pour reprendre une exécution interrompue (inutile en rejeu)
+        journal = None
+        if not args.replay:
+            journal = SyncJournal(journal_file)
+            if args.no_resume:
+                journal.complete()
+
+        # Budget d'appels Google (compteur journalier non persisté en rejeu)
+        budget = QuotaBudget(
+            per_run=args.quota_per_run,
+            per_day=args.quota_per_day,
+            state_path=None if args.replay else quota_state_file
+        )
 
-            if enable_notifications:
-                notify_error(error_msg, "Token expiré ou révoqué. Supprimez token.json et réessayez.")
+        # Profilage optionnel de la synchronisation
+        profiler = None
+        if args.profile:
+            profile_output = args.profile_output or datetime.datetime.now().strftime("profile-%Y%m%d-%H%M%S")
+            profiler = SyncProfiler(profile_output, mode=args.profile, phases=profile_phases)
 
-            if not args.no_healthcheck:
-                send_healthcheck_ping("fail", f"{error_msg}\n\n{error_details}")
-
-            sys.exit(1)
+        # En rejeu, l'horloge est celle de la synchronisation enregistrée
+        now = None
+        if args.replay:
+            recorded_now = cassette.recorded_now()
+            if recorded_now:
+                logger.info("🕰️ Horloge du rejeu fixée au %s", recorded_now.isoformat())
+                now = lambda: recorded_now
 
         # Synchronisation des calendriers
         synchronizer = CalendarSynchronizer(
             exchange_service=exchange_service,
             google_service=google_service,
-            calendar_id=google_calendar_id,
-            timezone=timezone
+            calendar_id=google_calendar_id or "replay",
+            timezone=timezone,
+            journal=journal,
+            profiler=profiler,
+            budget=budget,
+            now=now
         )
 
-        created, updated, deleted = synchronizer.synchronize(days_ahead=args.days, dry_run=args.dry_run)
+        if profiler:
+            profiler.start()
+        try:
+            created, updated, deleted = synchronizer.synchronize(days_ahead=args.days, dry_run=args.dry_run)
+        finally:
+            if profiler:
+                profiler.stop()
 
         # Envoyer un ping de succès avec les statistiques
         if not args.no_healthcheck:
-            success_msg = f"Synchronisation réussie: {created} créés, {updated} mis à jour, {deleted} supprimés"
+            success_msg = (f"Synchronisation réussie: {created} créés, {updated} mis à jour, {deleted} supprimés, "
+                           f"{synchronizer.deferred} reportés, {synchronizer.duplicates_removed} doublons supprimés, "
+                           f"{synchronizer.duplicates_deferred} doublons reportés")
             send_healthcheck_ping("success", success_msg)
 
     except Exception as e:
         error_message = f"Erreur lors de la synchronisation: {str(e)}"
         error_details = format_exception(e)
 
-        print(f"\n❌ {error_message}")
-        print(f"\nDétails: {error_details}")
+        logger.error("❌ %s", error_message)
+        logger.error("Détails: %s", error_details)
 
         # Envoyer notification de bureau
         if enable_notifications:
@@ -15,24 +15,23 @@ NOW=$(date '+%Y-%m-%d %H:%M:%S')
 
 # Vérifie que le venv existe
 if [ ! -d "$VENV_DIR" ]; then
-  echo "[$NOW] ❌ Environnement virtuel introuvable : $VENV_DIR" >> "$LOG_FILE"
+  echo "[$NOW] ❌ Environnement virtuel introuvable : $VENV_DIR" >&2
   exit 1
 fi
 
 # Active le venv
 source "$VENV_DIR/bin/activate"
 
-# Exécute la synchro
-echo "[$NOW] 🔁 Démarrage de la synchronisation Exchange → Google Calendar..." >> "$LOG_FILE"
-python3 "$PYTHON_SCRIPT" >> "$LOG_FILE" 2>&1
+# Exécute la synchro (le script gère lui-même le fichier de log et sa rotation)
+python3 "$PYTHON_SCRIPT" --log-file "$LOG_FILE"
 STATUS=$?
 
-# Log du résultat
-if [ $STATUS -eq 0 ]; then
-  echo "[$NOW] ✅ Synchronisation terminée avec succès." >> "$LOG_FILE"
-else
-  echo "[$NOW] ⚠️ Erreur pendant la synchronisation (code $STATUS)." >> "$LOG_FILE"
+# Signale l'échec sur la sortie d'erreur (remonté par cron)
+if [ $STATUS -ne 0 ]; then
+  echo "[$NOW] ⚠️ Erreur pendant la synchronisation (code $STATUS). Voir $LOG_FILE" >&2
 fi
 
 # Désactive le venv
 deactivate 2>/dev/null || true
+
+exit $STATUS
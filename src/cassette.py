@@ -0,0 +1,425 @@
+"""Enregistrement et rejeu des échanges EWS / Google Calendar (cassettes)."""
+
+import os
+import json
+import time
+import hashlib
+import datetime
+import logging
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.datetime_utils import normalize_str
+from src.google_service import get_http_status
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+
+# Champs d'un événement Google conservés dans une cassette (les autres sont ignorés)
+GOOGLE_EVENT_FIELDS = ('id', 'status', 'start', 'end', 'extendedProperties',
+                       'summary', 'location', 'description', 'updated', 'recurringEventId')
+
+# Paramètres de requête Google conservés tels quels
+GOOGLE_REQUEST_PARAMS = ('eventId', 'timeMin', 'timeMax', 'singleEvents', 'pageToken', 'maxResults')
+
+
+class CassetteError(Exception):
+    """Erreur de lecture ou de rejeu d'une cassette."""
+
+
+class ReplayedHttpError(Exception):
+    """Erreur HTTP de l'API Google rejouée depuis une cassette."""
+
+    def __init__(self, status: int, message: str, reasons: Optional[List[str]] = None):
+        """Initialise l'erreur avec le code HTTP et les motifs enregistrés."""
+        super().__init__(message)
+        self.resp = SimpleNamespace(status=status)
+        self.error_details = [{'reason': reason} for reason in reasons or []]
+
+
+class Cassette:
+    """
+    Contient les échanges enregistrés lors d'une synchronisation.
+
+    Les textes (titres, lieux, descriptions, adresses) sont remplacés à
+    l'enregistrement par une empreinte salée : deux valeurs identiques
+    restent identiques, ce qui préserve le résultat de la comparaison.
+    """
+
+    def __init__(self, path: str, interactions: Optional[List[Dict]] = None):
+        """Initialise une cassette vide ou chargée."""
+        self.path = path
+        self.interactions = interactions or []
+        self._salt = os.urandom(16)
+        self._cursors: Dict[str, int] = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'Cassette':
+        """Charge une cassette depuis un fichier JSON."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CassetteError(f"Cassette illisible {path}: {e}") from e
+
+        if data.get('version') != CASSETTE_VERSION:
+            raise CassetteError(f"Version de cassette non supportée : {data.get('version')}")
+
+        return cls(path, data.get('interactions', []))
+
+    def save(self) -> None:
+        """Écrit la cassette sur disque."""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': CASSETTE_VERSION,
+                'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'interactions': self.interactions,
+            }, f, ensure_ascii=False, indent=1)
+
+        logger.info("📼 Cassette enregistrée : %s (%d échanges)", self.path, len(self.interactions))
+
+    def add(self, method: str, request: Dict, response: Any = None,
+            error: Optional[Dict] = None, duration: float = 0.0) -> None:
+        """Ajoute un échange enregistré."""
+        entry = {'method': method, 'request': request, 'duration': round(duration, 6)}
+        if error is not None:
+            entry['error'] = error
+        else:
+            entry['response'] = response
+        self.interactions.append(entry)
+
+    def next(self, method: str) -> Optional[Dict]:
+        """Retourne le prochain échange enregistré pour une méthode (None si épuisé)."""
+        position = self._cursors.get(method, 0)
+        for i in range(position, len(self.interactions)):
+            if self.interactions[i]['method'] == method:
+                self._cursors[method] = i + 1
+                return self.interactions[i]
+
+        self._cursors[method] = len(self.interactions)
+        return None
+
+    def recorded_now(self) -> Optional[datetime.datetime]:
+        """
+        Retourne l'heure de la synchronisation enregistrée.
+
+        Il s'agit du début de la période demandée à Exchange, c'est-à-dire
+        l'horloge de la synchronisation d'origine (None si inconnue).
+        """
+        for interaction in self.interactions:
+            if interaction['method'] == 'exchange.get_events':
+                start = interaction.get('request', {}).get('start')
+                try:
+                    return datetime.datetime.fromisoformat(start) if start else None
+                except ValueError:
+                    return None
+        return None
+
+    def anonymize(self, value: Optional[str]) -> str:
+        """Remplace un texte par une empreinte stable pendant l'enregistrement."""
+        value = normalize_str(value)
+        if not value:
+            return ''
+        return 'anon-' + hashlib.sha256(self._salt + value.encode('utf-8')).hexdigest()[:16]
+
+    def anonymize_email(self, value: Optional[str]) -> str:
+        """Remplace une adresse électronique par une adresse fictive stable."""
+        if not value:
+            return ''
+        return f"{self.anonymize(value.lower())}@example.invalid"
+
+    def anonymize_exchange_event(self, event: Dict) -> Dict:
+        """Anonymise et sérialise un événement Exchange."""
+        return dict(
+            event,
+            subject=self.anonymize(event['subject']),
+            location=self.anonymize(event['location']),
+            body=self.anonymize(event['body']),
+            organizer=self.anonymize_email(event['organizer']),
+            start=event['start'].isoformat(),
+            end=event['end'].isoformat(),
+        )
+
+    def anonymize_google_event(self, event: Dict) -> Dict:
+        """Anonymise un événement Google en ne conservant que les champs utiles."""
+        kept = {k: event[k] for k in GOOGLE_EVENT_FIELDS if k in event}
+        for key in ('summary', 'location', 'description'):
+            if key in kept:
+                kept[key] = self.anonymize(kept[key])
+        return kept
+
+    def anonymize_google_payload(self, payload: Any) -> Any:
+        """Anonymise une requête ou une réponse de l'API Google Calendar."""
+        if not isinstance(payload, dict):
+            return payload
+
+        # Réponse d'une liste d'événements
+        if 'items' in payload:
+            result = {'items': [self.anonymize_google_event(e) for e in payload['items']]}
+            if 'nextPageToken' in payload:
+                result['nextPageToken'] = payload['nextPageToken']
+            return result
+
+        # Réponse d'une insertion ou d'une mise à jour
+        if 'id' in payload:
+            return self.anonymize_google_event(payload)
+
+        # Paramètres d'une requête
+        result = {}
+        for key, value in payload.items():
+            if key == 'calendarId':
+                result[key] = self.anonymize_email(value)
+            elif key == 'body':
+                result[key] = self.anonymize_google_event(value)
+            elif key in GOOGLE_REQUEST_PARAMS:
+                result[key] = value
+        return result
+
+
+def _describe_error(error: Exception) -> Dict:
+    """Décrit une erreur de l'API Google sans son message (qui peut contenir des données)."""
+    details = getattr(error, 'error_details', None)
+    reasons = [d.get('reason') for d in details if isinstance(d, dict)] if isinstance(details, list) else []
+    return {'status': get_http_status(error), 'message': type(error).__name__, 'reasons': reasons}
+
+
+def _restore_exchange_event(event: Dict) -> Dict:
+    """Reconstruit un événement Exchange depuis sa forme sérialisée."""
+    return dict(
+        event,
+        start=datetime.datetime.fromisoformat(event['start']),
+        end=datetime.datetime.fromisoformat(event['end']),
+    )
+
+
+class RecordingExchangeService:
+    """Enveloppe un ExchangeCalendarService et enregistre ses lectures."""
+
+    def __init__(self, inner: Any, cassette: Cassette):
+        """Initialise l'enregistreur."""
+        self.inner = inner
+        self.cassette = cassette
+
+    def connect(self) -> bool:
+        """Établit la connexion avec le serveur Exchange."""
+        return self.inner.connect()
+
+    def get_events(self, start_date: datetime.datetime, end_date: datetime.datetime) -> List[Dict]:
+        """Récupère les événements Exchange et enregistre l'échange."""
+        started = time.perf_counter()
+        events = self.inner.get_events(start_date, end_date)
+
+        self.cassette.add(
+            'exchange.get_events',
+            {'start': start_date.isoformat(), 'end': end_date.isoformat()},
+            [self.cassette.anonymize_exchange_event(ev) for ev in events],
+            duration=time.perf_counter() - started
+        )
+        return events
+
+
+class _RecordingRequest:
+    """Requête de l'API Google dont l'exécution est enregistrée."""
+
+    def __init__(self, request: Any, method: str, kwargs: Dict, cassette: Cassette):
+        self._request = request
+        self._method = method
+        self._kwargs = kwargs
+        self._cassette = cassette
+
+    def execute(self) -> Any:
+        """Exécute la requête et enregistre la réponse (ou l'erreur)."""
+        request = self._cassette.anonymize_google_payload(self._kwargs)
+        started = time.perf_counter()
+        try:
+            response = self._request.execute()
+        except Exception as e:
+            self._cassette.add(self._method, request, error=_describe_error(e),
+                               duration=time.perf_counter() - started)
+            raise
+
+        self._cassette.add(self._method, request, self._cassette.anonymize_google_payload(response),
+                           duration=time.perf_counter() - started)
+        return response
+
+
+class _RecordingEvents:
+    """Ressource `events()` de l'API Google dont les requêtes sont enregistrées."""
+
+    def __init__(self, events: Any, cassette: Cassette):
+        self._events = events
+        self._cassette = cassette
+
+    def __getattr__(self, name: str) -> Any:
+        def build(**kwargs):
+            return _RecordingRequest(getattr(self._events, name)(**kwargs), f'events.{name}', kwargs, self._cassette)
+        return build
+
+
+class _RecordingBatch:
+    """Requête batch de l'API Google dont chaque sous-requête est enregistrée."""
+
+    def __init__(self, inner: Any, cassette: Cassette, callback: Any):
+        self._cassette = cassette
+        self._callback = callback
+        self._requests: Dict[str, _RecordingRequest] = {}
+        self._batch = inner.new_batch_http_request(callback=self._on_response)
+
+    def add(self, request: _RecordingRequest, callback: Any = None, request_id: Optional[str] = None) -> None:
+        """Ajoute une sous-requête au lot."""
+        request_id = request_id or str(len(self._requests))
+        self._requests[request_id] = request
+        self._batch.add(request._request, request_id=request_id)
+
+    def execute(self) -> None:
+        """Exécute le lot et enregistre sa durée."""
+        started = time.perf_counter()
+        self._batch.execute()
+        self._cassette.add('batch', {'size': len(self._requests)}, duration=time.perf_counter() - started)
+
+    def _on_response(self, request_id: str, response: Any, exception: Optional[Exception]) -> None:
+        """Enregistre la réponse d'une sous-requête puis la transmet."""
+        request = self._requests[request_id]
+        payload = self._cassette.anonymize_google_payload(request._kwargs)
+
+        if exception is not None:
+            self._cassette.add(request._method, payload,
+                               error=_describe_error(exception))
+        else:
+            self._cassette.add(request._method, payload, self._cassette.anonymize_google_payload(response))
+
+        if self._callback:
+            self._callback(request_id, response, exception)
+
+
+class RecordingGoogleService:
+    """Enveloppe le client Google Calendar et enregistre les requêtes exécutées."""
+
+    def __init__(self, inner: Any, cassette: Cassette):
+        """Initialise l'enregistreur."""
+        self.inner = inner
+        self.cassette = cassette
+
+    def events(self) -> _RecordingEvents:
+        """Retourne la ressource `events` instrumentée."""
+        return _RecordingEvents(self.inner.events(), self.cassette)
+
+    def new_batch_http_request(self, callback: Any = None) -> _RecordingBatch:
+        """Retourne une requête batch instrumentée."""
+        return _RecordingBatch(self.inner, self.cassette, callback)
+
+
+class _Replayer:
+    """Base commune des services rejoués depuis une cassette."""
+
+    def __init__(self, cassette: Cassette, latency: str = 'original'):
+        """
+        Initialise le rejeu.
+
+        Args:
+            cassette: Cassette chargée
+            latency: 'original' pour reproduire les durées enregistrées, 'zero' sinon
+        """
+        self.cassette = cassette
+        self.latency = latency
+
+    def _wait(self, interaction: Dict) -> None:
+        """Reproduit la latence enregistrée si demandé."""
+        if self.latency == 'original' and interaction.get('duration'):
+            time.sleep(interaction['duration'])
+
+
+class ReplayExchangeService(_Replayer):
+    """Remplace ExchangeCalendarService en rejouant une cassette."""
+
+    def connect(self) -> bool:
+        """Aucune connexion n'est nécessaire en rejeu."""
+        return True
+
+    def get_events(self, start_date: datetime.datetime, end_date: datetime.datetime) -> List[Dict]:
+        """Retourne les événements Exchange enregistrés."""
+        interaction = self.cassette.next('exchange.get_events')
+        if interaction is None:
+            raise CassetteError("Aucune lecture Exchange enregistrée dans la cassette")
+
+        self._wait(interaction)
+        return [_restore_exchange_event(ev) for ev in interaction['response']]
+
+
+class _ReplayRequest:
+    """Requête de l'API Google servie depuis une cassette."""
+
+    def __init__(self, replayer: 'ReplayGoogleService', method: str, kwargs: Dict):
+        self._replayer = replayer
+        self._method = method
+        self._kwargs = kwargs
+
+    def execute(self) -> Any:
+        """Retourne la réponse enregistrée (ou lève l'erreur enregistrée)."""
+        interaction = self._replayer.cassette.next(self._method)
+
+        if interaction is None:
+            if self._method == 'events.list':
+                raise CassetteError("Aucune lecture Google enregistrée dans la cassette")
+            # Écriture non enregistrée (le code a changé depuis l'enregistrement) : réponse simulée
+            return dict(self._kwargs.get('body') or {}, id=self._kwargs.get('eventId', ''))
+
+        self._replayer._wait(interaction)
+        if 'error' in interaction:
+            error = interaction['error']
+            raise ReplayedHttpError(error.get('status'), error.get('message', ''), error.get('reasons'))
+        return interaction.get('response')
+
+
+class _ReplayEvents:
+    """Ressource `events()` servie depuis une cassette."""
+
+    def __init__(self, replayer: 'ReplayGoogleService'):
+        self._replayer = replayer
+
+    def __getattr__(self, name: str) -> Any:
+        def build(**kwargs):
+            return _ReplayRequest(self._replayer, f'events.{name}', kwargs)
+        return build
+
+
+class _ReplayBatch:
+    """Requête batch servie depuis une cassette."""
+
+    def __init__(self, replayer: 'ReplayGoogleService', callback: Any):
+        self._replayer = replayer
+        self._callback = callback
+        self._requests: List[Tuple[str, _ReplayRequest]] = []
+
+    def add(self, request: _ReplayRequest, callback: Any = None, request_id: Optional[str] = None) -> None:
+        """Ajoute une sous-requête au lot."""
+        self._requests.append((request_id or str(len(self._requests)), request))
+
+    def execute(self) -> None:
+        """Rejoue chaque sous-requête et transmet son résultat."""
+        interaction = self._replayer.cassette.next('batch')
+        if interaction is not None:
+            self._replayer._wait(interaction)
+
+        for request_id, request in self._requests:
+            try:
+                response = request.execute()
+            except Exception as e:
+                if self._callback:
+                    self._callback(request_id, None, e)
+            else:
+                if self._callback:
+                    self._callback(request_id, response, None)
+
+
+class ReplayGoogleService(_Replayer):
+    """Remplace le client Google Calendar en rejouant une cassette."""
+
+    def events(self) -> _ReplayEvents:
+        """Retourne la ressource `events` rejouée."""
+        return _ReplayEvents(self)
+
+    def new_batch_http_request(self, callback: Any = None) -> _ReplayBatch:
+        """Retourne une requête batch rejouée."""
+        return _ReplayBatch(self, callback)
@@ -2,6 +2,7 @@
 
 import re
 import datetime
+import logging
 from typing import Dict, List, Optional
 
 import pytz
@@ -9,6 +10,8 @@ from exchangelib import Credentials, Account, DELEGATE
 
 from src.utils.datetime_utils import to_py_datetime
 
+logger = logging.getLogger(__name__)
+
 
 def clean_subject(subject: Optional[str]) -> str:
     """Nettoie le titre des événements Outlook."""
@@ -42,10 +45,10 @@ class ExchangeCalendarService:
                 autodiscover=True,
                 access_type=DELEGATE
             )
-            print(f"✅ Connecté à Exchange : {self.account.primary_smtp_address}")
+            logger.info("✅ Connecté à Exchange : %s", self.account.primary_smtp_address)
             return True
         except Exception as e:
-            print(f"❌ Erreur de connexion Exchange : {e}")
+            logger.error("❌ Erreur de connexion Exchange : %s", e)
             return False
 
     def get_events(self, start_date: datetime.datetime, end_date: datetime.datetime) -> List[Dict]:
@@ -1,7 +1,8 @@
 """Service d'interaction avec l'API Google Calendar."""
 
 import os
-from typing import Any
+import hashlib
+from typing import Any, Optional
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -16,6 +17,39 @@ def get_exchange_uid(event: dict) -> str:
         return ''
 
 
+def make_google_event_id(exchange_uid: str) -> str:
+    """
+    Calcule un identifiant d'événement Google déterministe à partir de l'UID Exchange.
+
+    Google accepte les caractères base32hex (a-v, 0-9) : l'empreinte hexadécimale
+    convient, et rend les insertions idempotentes en cas de nouvelle tentative.
+    """
+    return hashlib.sha1(exchange_uid.encode('utf-8')).hexdigest()
+
+
+def get_http_status(error: Exception) -> Optional[int]:
+    """Récupère le code HTTP d'une erreur de l'API Google (None si absent)."""
+    return getattr(getattr(error, 'resp', None), 'status', None)
+
+
+QUOTA_ERROR_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded', 'dailyLimitExceeded')
+
+
+def is_quota_error(error: Exception) -> bool:
+    """Indique si une erreur de l'API Google correspond à un dépassement de quota."""
+    status = get_http_status(error)
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+
+    # HttpError.error_details reprend la liste `errors` de la réponse JSON de l'API
+    details = getattr(error, 'error_details', None)
+    if not isinstance(details, list):
+        return False
+    return any(isinstance(d, dict) and d.get('reason') in QUOTA_ERROR_REASONS for d in details)
+
+
 class GoogleCalendarService:
     """Gère les interactions avec l'API Google Calendar."""
 
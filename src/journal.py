@@ -0,0 +1,109 @@
+"""Journal d'écriture anticipée (write-ahead) des modifications Google Calendar."""
+
+import os
+import json
+import time
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SyncJournal:
+    """
+    Enregistre les modifications prévues avant de les appliquer.
+
+    Le fichier est au format JSON Lines : une ligne `plan` décrivant toutes les
+    modifications, puis une ligne `done` ou `error` par modification traitée.
+    Chaque ligne est écrite et synchronisée sur disque immédiatement, de sorte
+    qu'une exécution interrompue peut être reprise là où elle s'est arrêtée.
+    """
+
+    def __init__(self, path: str, max_age: int = 3 * 3600):
+        """
+        Initialise le journal.
+
+        Args:
+            path: Chemin du fichier journal
+            max_age: Âge maximal (secondes) d'un plan pour qu'il soit repris
+        """
+        self.path = path
+        self.max_age = max_age
+
+    def begin(self, calendar_id: str, mutations: List[Dict]) -> None:
+        """Écrit le plan des modifications à appliquer."""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            self._write_line(f, {
+                'type': 'plan',
+                'calendar_id': calendar_id,
+                'created_at': time.time(),
+                'mutations': mutations,
+            })
+
+    def record(self, index: int, status: str, error: Optional[str] = None) -> None:
+        """Enregistre le résultat d'une modification ('done' ou 'error')."""
+        entry = {'type': status, 'index': index}
+        if error:
+            entry['error'] = error
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            self._write_line(f, entry)
+
+    def complete(self) -> None:
+        """Clôt le journal une fois toutes les modifications traitées."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def pending(self, calendar_id: str) -> List[Dict]:
+        """
+        Retourne les modifications jamais tentées d'une exécution interrompue.
+
+        Les modifications en échec (`error`) ne sont pas reprises : une erreur
+        persistante bloquerait sinon toutes les exécutions suivantes. Elles seront
+        recalculées par la comparaison complète de l'exécution suivante.
+
+        Chaque modification retournée porte sa position dans le plan (`index`).
+        Un journal illisible, obsolète ou visant un autre calendrier est ignoré.
+        """
+        if not os.path.exists(self.path):
+            return []
+
+        plan = None
+        attempted = set()
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Dernière ligne tronquée par l'interruption
+                        continue
+
+                    if entry.get('type') == 'plan':
+                        plan = entry
+                    elif entry.get('type') in ('done', 'error'):
+                        attempted.add(entry['index'])
+        except OSError as e:
+            logger.warning("⚠️ Journal illisible %s: %s", self.path, e)
+            return []
+
+        if not plan or plan.get('calendar_id') != calendar_id:
+            self.complete()
+            return []
+
+        if time.time() - plan.get('created_at', 0) > self.max_age:
+            logger.info("🗑️ Journal de reprise obsolète ignoré : %s", self.path)
+            self.complete()
+            return []
+
+        return [dict(m, index=i) for i, m in enumerate(plan['mutations']) if i not in attempted]
+
+    @staticmethod
+    def _write_line(f, entry: Dict) -> None:
+        """Écrit une ligne JSON et force son écriture sur disque."""
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
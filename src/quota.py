@@ -0,0 +1,106 @@
+"""Suivi du budget d'appels à l'API Google Calendar."""
+
+import os
+import json
+import datetime
+import logging
+from typing import Optional
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Les quotas journaliers Google sont réinitialisés à minuit, heure du Pacifique
+QUOTA_TIMEZONE = pytz.timezone('America/Los_Angeles')
+
+
+class QuotaExhaustedError(Exception):
+    """Le budget de quota ne permet pas un appel supplémentaire."""
+
+
+class QuotaBudget:
+    """
+    Limite le nombre d'appels à l'API Google par exécution et par jour.
+
+    Le compteur journalier est conservé dans un fichier d'état entre deux
+    exécutions. Une limite à None (ou 0) signifie « illimité ».
+    """
+
+    def __init__(self, per_run: Optional[int] = None, per_day: Optional[int] = None,
+                 state_path: Optional[str] = None):
+        """
+        Initialise le budget.
+
+        Args:
+            per_run: Nombre maximal d'appels pour cette exécution
+            per_day: Nombre maximal d'appels par jour (toutes exécutions confondues)
+            state_path: Fichier d'état (aucune persistance si None)
+        """
+        self.per_run = per_run or None
+        self.per_day = per_day or None
+        self.state_path = state_path
+        self.run_used = 0
+        self.day = self._today()
+        self.day_used = 0
+        self.exhausted = False
+        self._load()
+
+    @staticmethod
+    def _today() -> str:
+        """Retourne le jour de quota courant."""
+        return datetime.datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    def _load(self) -> None:
+        """Charge le compteur journalier depuis le fichier d'état."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("⚠️ État de quota illisible %s: %s", self.state_path, e)
+            return
+
+        if state.get('day') == self.day:
+            self.day_used = int(state.get('used', 0))
+
+    def save(self) -> None:
+        """Enregistre le compteur journalier."""
+        if not self.state_path:
+            return
+
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'day': self.day, 'used': self.day_used}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def remaining(self) -> Optional[int]:
+        """Retourne le nombre d'appels encore autorisés (None si illimité)."""
+        if self.exhausted:
+            return 0
+
+        limits = []
+        if self.per_run is not None:
+            limits.append(self.per_run - self.run_used)
+        if self.per_day is not None:
+            limits.append(self.per_day - self.day_used)
+
+        return max(0, min(limits)) if limits else None
+
+    def allows(self, calls: int = 1) -> bool:
+        """Indique si `calls` appels tiennent dans le budget."""
+        remaining = self.remaining()
+        return remaining is None or remaining >= calls
+
+    def consume(self, calls: int = 1) -> None:
+        """Comptabilise des appels effectués."""
+        if self._today() != self.day:
+            self.day, self.day_used = self._today(), 0
+
+        self.run_used += calls
+        self.day_used += calls
+
+    def exhaust(self) -> None:
+        """Signale que Google a refusé un appel pour dépassement de quota."""
+        self.exhausted = True
@@ -1,79 +1,308 @@
 """Gestion de la synchronisation entre Exchange et Google Calendar."""
 
 import datetime
-from typing import Dict, List, Tuple, Any, Set
+import logging
+import threading
+import contextlib
+import concurrent.futures
+from typing import Callable, Dict, List, Optional, Tuple, Any, Set
 
 import pytz
 
 from src.utils.datetime_utils import (
     to_utc_datetime, normalize_str, datetimes_equal, parse_google_start
 )
-from src.google_service import get_exchange_uid
+from src.google_service import get_exchange_uid, make_google_event_id, get_http_status, is_quota_error
+from src.journal import SyncJournal
+from src.quota import QuotaBudget, QuotaExhaustedError
+from src.utils.profiling_utils import SyncProfiler
+
+logger = logging.getLogger(__name__)
 
 
 class CalendarSynchronizer:
     """Gère la synchronisation entre Exchange et Google Calendar."""
 
-    def __init__(self, exchange_service: Any, google_service: Any, calendar_id: str, timezone: str):
-        """Initialise le synchronisateur."""
+    def __init__(self, exchange_service: Any, google_service: Any, calendar_id: str, timezone: str,
+                 journal: Optional[SyncJournal] = None, profiler: Optional[SyncProfiler] = None,
+                 budget: Optional[QuotaBudget] = None,
+                 now: Optional[Callable[[], datetime.datetime]] = None):
+        """Initialise le synchronisateur (`now` fixe l'horloge, par exemple lors d'un rejeu)."""
         self.exchange_service = exchange_service
         self.google_service = google_service
         self.calendar_id = calendar_id
         self.timezone = timezone
+        self.journal = journal
+        self.profiler = profiler
+        self.budget = budget
+        self.now = now
+        self.deferred = 0
+        self.duplicates_removed = 0
+        self.duplicates_deferred = 0
 
     def synchronize(self, days_ahead: int, dry_run: bool = False) -> Tuple[int, int, int]:
         """Synchronise les événements entre Exchange et Google Calendar."""
+        self.deferred = 0
+        self.duplicates_removed = 0
+        self.duplicates_deferred = 0
+
+        # Le compteur journalier est enregistré quelle que soit l'issue de l'exécution
+        try:
+            return self._synchronize(days_ahead, dry_run)
+        finally:
+            if self.budget:
+                self.budget.save()
+
+    def _synchronize(self, days_ahead: int, dry_run: bool) -> Tuple[int, int, int]:
+        """Déroule la synchronisation (reprise, lecture, comparaison, écriture)."""
+        # Reprise d'une exécution interrompue : seules les modifications jamais tentées sont
+        # appliquées ; les échecs seront recalculés par la prochaine comparaison complète
+        if not dry_run and self.journal:
+            pending = self.journal.pending(self.calendar_id)
+            if pending:
+                logger.info("♻️ Reprise d'une synchronisation interrompue : %d modifications restantes.",
+                            len(pending))
+                with self._phase('write'):
+                    counts = self._apply_mutations(pending)
+                return self._finish(counts)
+
         # Périodes de synchronisation
-        start = datetime.datetime.now(pytz.UTC)
+        start = self._now()
         end = start + datetime.timedelta(days=days_ahead)
 
-        print(f"📥 Lecture des événements Outlook du {start.date()} au {end.date()}...")
+        logger.info("📥 Lecture des événements Outlook du %s au %s...", start.date(), end.date())
+
+        if dry_run:
+            with self._phase('fetch'):
+                outlook_events = self.exchange_service.get_events(start, end)
+            self._display_events_summary(outlook_events)
+            logger.info("🔎 Mode simulation (--dry-run). Aucun changement ne sera appliqué.")
+            return 0, 0, 0
+
+        # Sans budget pour lister Google, rien ne peut être comparé
+        if self.budget and not self.budget.allows():
+            return self._skip_exhausted()
 
-        # Récupération des événements Exchange
-        outlook_events = self.exchange_service.get_events(start, end)
+        # Les lectures Exchange et Google sont indépendantes : elles sont menées en parallèle
+        try:
+            with self._phase('fetch'):
+                outlook_events, google_events = self._fetch_events(start, end)
+        except QuotaExhaustedError:
+            return self._skip_exhausted()
 
         # Affichage des événements récupérés
         self._display_events_summary(outlook_events)
 
-        if dry_run:
-            print("\n🔎 Mode simulation (--dry-run). Aucun changement ne sera appliqué.")
-            return 0, 0, 0
+        # Création d'un index des événements Google par UID Exchange
+        with self._phase('diff'):
+            google_index, duplicates = self._index_google_events(google_events)
+            exchange_uids = {ev['uid'] for ev in outlook_events}
 
-        # Récupération des événements Google
-        now_utc = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        future = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=days_ahead)).isoformat()
+        counts = self._process_events(outlook_events, google_index, exchange_uids)
 
-        print("\n🔗 Connexion à Google Calendar...")
+        # Nettoyage des doublons, après les modifications prioritaires
+        with self._phase('write'):
+            self._remove_duplicates(duplicates)
 
-        events_result = self.google_service.events().list(
-            calendarId=self.calendar_id,
-            timeMin=now_utc,
-            timeMax=future,
-            singleEvents=True
-        ).execute()
+        return self._finish(counts)
 
-        google_events = events_result.get('items', [])
+    def _index_google_events(self, google_events: List[Dict]) -> Tuple[Dict[str, Dict], List[Dict]]:
+        """
+        Indexe les événements Google par UID Exchange et repère les doublons.
 
-        # Création d'un index des événements Google par UID Exchange
-        google_index = {get_exchange_uid(e): e for e in google_events}
-        exchange_uids = {ev['uid'] for ev in outlook_events}
+        Pour chaque UID, l'événement conservé est celui portant l'identifiant
+        déterministe, à défaut le plus récemment modifié ; les autres sont
+        retournés comme doublons à supprimer.
+        """
+        google_index: Dict[str, Dict] = {}
+        duplicates: List[Dict] = []
+
+        for g_ev in google_events:
+            uid = get_exchange_uid(g_ev)
+            current = google_index.get(uid)
+
+            if current is None or not uid:
+                google_index[uid] = g_ev
+                continue
+
+            canonical_id = make_google_event_id(uid)
+            if (g_ev['id'] == canonical_id, g_ev.get('updated', '')) > \
+                    (current['id'] == canonical_id, current.get('updated', '')):
+                google_index[uid], g_ev = g_ev, current
+            duplicates.append(g_ev)
 
-        created, updated, deleted = self._process_events(outlook_events, google_index, exchange_uids, dry_run)
+        if duplicates:
+            logger.info("👯 %d doublons détectés dans Google Calendar.", len(duplicates))
 
-        print(f"\n✅ Synchronisation terminée : {created} créés, {updated} mis à jour, {deleted} supprimés.")
-        return created, updated, deleted
+        return google_index, duplicates
+
+    def _remove_duplicates(self, duplicates: List[Dict], batch_size: int = 50) -> None:
+        """Supprime les doublons par lots (requêtes batch de l'API Google)."""
+        quota_reached = []
+
+        def on_response(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+            if exception is None or get_http_status(exception) in (404, 410):
+                self.duplicates_removed += 1
+            elif is_quota_error(exception):
+                quota_reached.append(request_id)
+            else:
+                logger.warning("⚠️ Erreur suppression doublon %s: %s", request_id, exception)
+
+        events = self.google_service.events()
+        position = 0
+        while position < len(duplicates):
+            # Le dernier lot est réduit à ce que le budget autorise encore
+            size = batch_size
+            remaining = self.budget.remaining() if self.budget else None
+            if remaining is not None:
+                size = min(size, remaining)
+            if size <= 0:
+                self._defer_duplicates(len(duplicates) - position,
+                                       "budget de quota insuffisant pour supprimer les doublons")
+                break
+
+            chunk = duplicates[position:position + size]
+            batch = self.google_service.new_batch_http_request(callback=on_response)
+            for g_ev in chunk:
+                batch.add(events.delete(calendarId=self.calendar_id, eventId=g_ev['id']), request_id=g_ev['id'])
+                self._count_call()
+            batch.execute()
+
+            # Les doublons non supprimés seront de nouveau détectés à la prochaine exécution
+            if quota_reached:
+                if self.budget:
+                    self.budget.exhaust()
+                self._defer_duplicates(len(duplicates) - position - len(chunk) + len(quota_reached),
+                                       "quota Google atteint lors de la suppression des doublons")
+                break
+
+            position += len(chunk)
+
+    def _now(self) -> datetime.datetime:
+        """Retourne l'heure courante (UTC), ou celle de l'horloge injectée."""
+        return self.now() if self.now else datetime.datetime.now(pytz.UTC)
+
+    def _phase(self, name: str) -> Any:
+        """Délimite une phase de la synchronisation pour le profileur."""
+        return self.profiler.phase(name) if self.profiler else contextlib.nullcontext()
+
+    def _fetch_events(self, start: datetime.datetime,
+                      end: datetime.datetime) -> Tuple[List[Dict], List[Dict]]:
+        """Récupère simultanément les événements Exchange et Google sur la période."""
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='google-list')
+        cancelled = threading.Event()
+        google_future = pool.submit(self._fetch_google_events, start, end, cancelled)
+
+        try:
+            outlook_events = self.exchange_service.get_events(start, end)
+        except Exception:
+            # L'erreur Exchange est remontée sans attendre Google, dont la lecture est interrompue ;
+            # une erreur Google, même postérieure, ne doit pas pour autant passer inaperçue
+            cancelled.set()
+            google_future.add_done_callback(self._log_google_error)
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+        try:
+            google_events = google_future.result()
+        finally:
+            pool.shutdown()
+
+        return outlook_events, google_events
+
+    @staticmethod
+    def _log_google_error(future: concurrent.futures.Future) -> None:
+        """Journalise l'erreur d'une lecture Google abandonnée."""
+        if not future.cancelled() and future.exception(timeout=0):
+            logger.error("❌ Erreur de lecture Google Calendar : %s", future.exception(timeout=0))
+
+    def _fetch_google_events(self, start: datetime.datetime, end: datetime.datetime,
+                             cancelled: Optional[threading.Event] = None) -> List[Dict]:
+        """Récupère les événements Google Calendar sur la période."""
+        # Exécutée dans un thread de travail, que cProfile ne suit pas d'office
+        with self.profiler.thread_profile() if self.profiler else contextlib.nullcontext():
+            return self._list_google_events(start, end, cancelled)
+
+    def _list_google_events(self, start: datetime.datetime, end: datetime.datetime,
+                            cancelled: Optional[threading.Event] = None) -> List[Dict]:
+        """Liste les événements Google Calendar, page par page (jusqu'à une éventuelle annulation)."""
+        logger.info("🔗 Lecture des événements Google Calendar...")
+
+        google_events: List[Dict] = []
+        page_token = None
+
+        # Google pagine les résultats (250 par défaut) et une page peut être incomplète
+        while not (cancelled and cancelled.is_set()):
+            params = {
+                'calendarId': self.calendar_id,
+                'timeMin': start.isoformat(),
+                'timeMax': end.isoformat(),
+                'singleEvents': True,
+            }
+            if page_token:
+                params['pageToken'] = page_token
+
+            if self.budget and not self.budget.allows():
+                raise QuotaExhaustedError("Budget de quota insuffisant pour lister Google Calendar")
+
+            self._count_call()
+            events_result = self.google_service.events().list(**params).execute()
+            google_events.extend(events_result.get('items', []))
+
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return google_events
+
+        return google_events
+
+    def _finish(self, counts: Tuple[int, int, int]) -> Tuple[int, int, int]:
+        """Clôt le journal et journalise le bilan de la synchronisation."""
+        # Les modifications reportées seront recalculées par la prochaine exécution
+        if self.journal:
+            self.journal.complete()
+
+        created, updated, deleted = counts
+        logger.info("✅ Synchronisation terminée : %d créés, %d mis à jour, %d supprimés, %d reportés, "
+                    "%d doublons supprimés, %d doublons reportés.",
+                    created, updated, deleted, self.deferred, self.duplicates_removed, self.duplicates_deferred,
+                    extra={'created_count': created, 'updated_count': updated, 'deleted_count': deleted,
+                           'deferred_count': self.deferred, 'duplicates_removed_count': self.duplicates_removed,
+                           'duplicates_deferred_count': self.duplicates_deferred})
+        return counts
+
+    def _skip_exhausted(self) -> Tuple[int, int, int]:
+        """Reporte toute l'exécution lorsque le budget ne permet plus de lister Google."""
+        logger.warning("⏳ Budget de quota épuisé : synchronisation reportée à la prochaine exécution.")
+        return self._finish((0, 0, 0))
+
+    def _count_call(self) -> None:
+        """Comptabilise un appel à l'API Google dans le budget de quota."""
+        if self.budget:
+            self.budget.consume()
 
     def _process_events(self, outlook_events: List[Dict],
                        google_index: Dict[str, Dict],
-                       exchange_uids: Set[str],
-                       dry_run: bool) -> Tuple[int, int, int]:
+                       exchange_uids: Set[str]) -> Tuple[int, int, int]:
         """Traite les événements pour synchronisation."""
-        created, updated, deleted = 0, 0, 0
+        with self._phase('diff'):
+            mutations = self._plan_mutations(outlook_events, google_index, exchange_uids)
+
+        with self._phase('write'):
+            # Le plan est journalisé avant toute écriture pour permettre la reprise
+            if self.journal:
+                self.journal.begin(self.calendar_id, mutations)
+
+            return self._apply_mutations([dict(m, index=i) for i, m in enumerate(mutations)])
+
+    def _plan_mutations(self, outlook_events: List[Dict],
+                        google_index: Dict[str, Dict],
+                        exchange_uids: Set[str]) -> List[Dict]:
+        """Calcule la liste des modifications à appliquer sur Google Calendar."""
+        mutations = []
 
         # Création/mise à jour des événements
         for ev in outlook_events:
             uid = ev['uid']
-            google_event = self._prepare_google_event(ev)
 
             if uid in google_index:
                 # Mise à jour d'un événement existant
@@ -81,44 +310,149 @@ class CalendarSynchronizer:
                 changes = self._detect_changes(g_ev, ev)
 
                 if changes:
-                    print(f"🔁 Mise à jour ({', '.join(changes)}): {ev['subject']}")
-                    if not dry_run:
-                        self.google_service.events().update(
-                            calendarId=self.calendar_id,
-                            eventId=g_ev['id'],
-                            body=google_event
-                        ).execute()
-                    updated += 1
+                    mutations.append({
+                        'action': 'update',
+                        'uid': uid,
+                        'event_id': g_ev['id'],
+                        'summary': ev['subject'],
+                        'start': ev['start'].astimezone(datetime.timezone.utc).isoformat(),
+                        'changes': changes,
+                        'body': self._prepare_google_event(ev),
+                    })
             else:
-                # Création d'un nouvel événement
-                print(f"➕ Nouveau : {ev['subject']}")
-                if not dry_run:
-                    self.google_service.events().insert(
-                        calendarId=self.calendar_id,
-                        body=google_event
-                    ).execute()
-                created += 1
+                # Création d'un nouvel événement, avec un identifiant déterministe
+                mutations.append({
+                    'action': 'insert',
+                    'uid': uid,
+                    'event_id': make_google_event_id(uid),
+                    'summary': ev['subject'],
+                    'start': ev['start'].astimezone(datetime.timezone.utc).isoformat(),
+                    'body': self._prepare_google_event(ev),
+                })
 
         # Suppression des événements qui n'existent plus dans Exchange
-        now_utc = datetime.datetime.now(datetime.timezone.utc)
+        now_utc = self._now()
         for g_ev in google_index.values():
             uid = get_exchange_uid(g_ev)
             start_dt = parse_google_start(g_ev)
 
             if uid and uid not in exchange_uids and start_dt and start_dt > now_utc:
-                if dry_run:
-                    print(f"[dry-run] ➖ supprimerait: {g_ev.get('summary')} ({uid}) à {start_dt.date()}")
+                mutations.append({
+                    'action': 'delete',
+                    'uid': uid,
+                    'event_id': g_ev['id'],
+                    'summary': g_ev.get('summary'),
+                    'start': start_dt.astimezone(datetime.timezone.utc).isoformat(),
+                })
+
+        # Les événements les plus proches sont traités en premier, au cas où le quota serait atteint
+        mutations.sort(key=lambda m: (m.get('start') is None, m.get('start') or ''))
+        return mutations
+
+    def _apply_mutations(self, mutations: List[Dict]) -> Tuple[int, int, int]:
+        """Applique les modifications, dans la limite du budget de quota, et journalise chacune."""
+        counts = {'insert': 0, 'update': 0, 'delete': 0}
+        failures = []
+
+        for position, m in enumerate(mutations):
+            # Ce qui dépasse le budget est reporté plutôt que de faire échouer l'exécution
+            if self.budget and not self.budget.allows():
+                self._defer(len(mutations) - position, "budget de quota épuisé")
+                break
+
+            try:
+                self._execute_mutation(m)
+            except QuotaExhaustedError:
+                self._defer(len(mutations) - position, "budget de quota épuisé")
+                break
+            except Exception as e:
+                if is_quota_error(e):
+                    if self.budget:
+                        self.budget.exhaust()
+                    self._defer(len(mutations) - position, f"quota Google atteint ({e})")
+                    break
+
+                if self.journal:
+                    self.journal.record(m['index'], 'error', str(e))
+
+                if m['action'] == 'delete':
+                    logger.warning("⚠️ Erreur suppression %s: %s", m['event_id'], e)
                 else:
-                    try:
-                        self.google_service.events().delete(
-                            calendarId=self.calendar_id,
-                            eventId=g_ev['id']
-                        ).execute()
-                        deleted += 1
-                    except Exception as e:
-                        print(f"⚠️ Erreur suppression {g_ev.get('id')}: {e}")
-
-        return created, updated, deleted
+                    # Une modification en échec ne doit pas bloquer les suivantes
+                    logger.error("❌ Erreur %s %s: %s", m['action'], m['summary'], e)
+                    failures.append(e)
+                continue
+
+            if self.journal:
+                self.journal.record(m['index'], 'done')
+            counts[m['action']] += 1
+
+        if failures:
+            raise RuntimeError(f"{len(failures)} modifications en échec (première : {failures[0]})") from failures[0]
+
+        return counts['insert'], counts['update'], counts['delete']
+
+    def _defer(self, count: int, reason: str) -> None:
+        """Reporte les modifications restantes à la prochaine exécution."""
+        self.deferred += count
+        logger.warning("⏳ %d modifications reportées à la prochaine exécution : %s", count, reason,
+                       extra={'deferred_count': count})
+
+    def _defer_duplicates(self, count: int, reason: str) -> None:
+        """Reporte la suppression des doublons restants (ils seront de nouveau détectés)."""
+        self.duplicates_deferred += count
+        logger.warning("⏳ %d suppressions de doublons reportées à la prochaine exécution : %s", count, reason,
+                       extra={'duplicates_deferred_count': count})
+
+    def _execute_mutation(self, mutation: Dict) -> None:
+        """Exécute une modification sur l'API Google Calendar."""
+        events = self.google_service.events()
+        action = mutation['action']
+
+        if action == 'insert':
+            logger.debug("➕ Nouveau : %s", mutation['summary'], extra={'action': action, 'uid': mutation['uid']})
+            try:
+                self._count_call()
+                events.insert(
+                    calendarId=self.calendar_id,
+                    body=dict(mutation['body'], id=mutation['event_id'])
+                ).execute()
+            except Exception as e:
+                if get_http_status(e) != 409:
+                    raise
+                # Déjà inséré par une exécution interrompue (ou supprimé puis recréé) : on met à jour,
+                # ce qui coûte un second appel
+                if self.budget and not self.budget.allows():
+                    raise QuotaExhaustedError() from e
+                self._count_call()
+                events.update(
+                    calendarId=self.calendar_id,
+                    eventId=mutation['event_id'],
+                    body=dict(mutation['body'], status='confirmed')
+                ).execute()
+
+        elif action == 'update':
+            logger.debug("🔁 Mise à jour (%s): %s", ', '.join(mutation.get('changes', [])), mutation['summary'],
+                         extra={'action': action, 'uid': mutation['uid']})
+            self._count_call()
+            events.update(
+                calendarId=self.calendar_id,
+                eventId=mutation['event_id'],
+                body=mutation['body']
+            ).execute()
+
+        elif action == 'delete':
+            try:
+                self._count_call()
+                events.delete(
+                    calendarId=self.calendar_id,
+                    eventId=mutation['event_id']
+                ).execute()
+            except Exception as e:
+                # Déjà supprimé (par exemple avant une interruption)
+                if get_http_status(e) not in (404, 410):
+                    raise
+            logger.debug("➖ Supprimé : %s", mutation['summary'], extra={'action': action, 'uid': mutation['uid']})
 
     def _prepare_google_event(self, exchange_event: Dict) -> Dict:
         """Prépare un événement au format Google Calendar."""
@@ -176,13 +510,17 @@ class CalendarSynchronizer:
         return changes
 
     def _display_events_summary(self, events: List[Dict]) -> None:
-        """Affiche un résumé des événements récupérés."""
-        print(f"📄 {len(events)} événements trouvés.\n")
+        """Journalise un résumé des événements récupérés (détail en mode debug)."""
+        logger.info("📄 %d événements trouvés.", len(events), extra={'fetched_count': len(events)})
+
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
 
+        tz = pytz.timezone(self.timezone)
         for ev in events:
             if ev['all_day']:
-                print(f"📅 {ev['start'].date()} | {ev['subject']} | 💤 Journée entière")
+                logger.debug("📅 %s | %s | 💤 Journée entière", ev['start'].date(), ev['subject'])
             else:
-                s_local = ev['start'].astimezone(pytz.timezone(self.timezone)).strftime('%d/%m %H:%M')
-                e_local = ev['end'].astimezone(pytz.timezone(self.timezone)).strftime('%H:%M')
-                print(f"🗓️ {s_local} → {e_local} | {ev['subject']} | 📍 {ev['location']}")
+                s_local = ev['start'].astimezone(tz).strftime('%d/%m %H:%M')
+                e_local = ev['end'].astimezone(tz).strftime('%H:%M')
+                logger.debug("🗓️ %s → %s | %s | 📍 %s", s_local, e_local, ev['subject'], ev['location'])
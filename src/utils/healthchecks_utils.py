@@ -1,9 +1,12 @@
 """Fonctions utilitaires pour l'intégration avec healthchecks.io."""
 
 import os
+import logging
 import requests
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 
 def send_healthcheck_ping(status: Optional[str] = None, message: Optional[str] = None) -> bool:
     """
@@ -19,14 +22,14 @@ def send_healthcheck_ping(status: Optional[str] = None, message: Optional[str] =
     healthcheck_url = os.getenv("HEALTHCHECK_URL")
     
     if not healthcheck_url:
-        print("❌ HEALTHCHECK_URL n'est pas définie dans les variables d'environnement")
+        logger.warning("❌ HEALTHCHECK_URL n'est pas définie dans les variables d'environnement")
         return False
 
     # Vérifier si la vérification SSL doit être désactivée
     verify_ssl = os.getenv("VERIFY_SSL", "true").lower() != "false"
 
     if not verify_ssl:
-        print("⚠️ Vérification SSL désactivée pour les requêtes healthchecks.io")
+        logger.warning("⚠️ Vérification SSL désactivée pour les requêtes healthchecks.io")
         # Supprimer les avertissements de sécurité si la vérification SSL est désactivée
         requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
@@ -42,24 +45,24 @@ def send_healthcheck_ping(status: Optional[str] = None, message: Optional[str] =
         if message and (status == "fail" or status == "success"):
             response = requests.post(url, data=message.encode('utf-8'), timeout=10, verify=verify_ssl)
         else:
-            print(f"url: {url}")
+            logger.debug("url: %s", url)
             response = requests.get(url, timeout=10, verify=verify_ssl)
 
         if response.status_code != 200:
-            print(f"❌ Erreur lors de l'envoi du ping healthcheck ({status}): Code HTTP {response.status_code}")
-            print(f"Réponse: {response.text}")
+            logger.error("❌ Erreur lors de l'envoi du ping healthcheck (%s): Code HTTP %s", status, response.status_code)
+            logger.error("Réponse: %s", response.text)
         else:
-            print(f"✅ Ping healthcheck envoyé avec succès ({status or 'standard'})")
+            logger.debug("✅ Ping healthcheck envoyé avec succès (%s)", status or 'standard')
 
         return response.status_code == 200
     except requests.RequestException as e:
         # Afficher l'erreur pour faciliter le débogage
-        print(f"❌ Exception lors de l'envoi du ping healthcheck ({status}): {type(e).__name__}: {str(e)}")
+        logger.error("❌ Exception lors de l'envoi du ping healthcheck (%s): %s: %s", status, type(e).__name__, e)
 
         # Si c'est une erreur de connexion, afficher plus de détails
         if isinstance(e, requests.ConnectionError):
-            print("  → Vérifiez votre connexion internet ou l'URL du healthcheck")
+            logger.error("  → Vérifiez votre connexion internet ou l'URL du healthcheck")
         elif isinstance(e, requests.Timeout):
-            print("  → Le délai d'attente a été dépassé lors de la connexion au serveur")
+            logger.error("  → Le délai d'attente a été dépassé lors de la connexion au serveur")
 
         return False
\ No newline at end of file
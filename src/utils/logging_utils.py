@@ -0,0 +1,109 @@
+"""Fonctions utilitaires pour la journalisation structurée."""
+
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Dict, List, Optional
+
+# Attributs standards d'un LogRecord, exclus des champs structurés
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+LOG_LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formate les enregistrements de log en une ligne JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Sérialise l'enregistrement, champs `extra` compris."""
+        payload: Dict = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def resolve_log_level(name: Optional[str], verbose: int = 0, quiet: bool = False) -> int:
+    """
+    Détermine le niveau de log effectif.
+
+    Args:
+        name: Niveau nommé ('debug', 'info', 'warning', 'error'), défaut 'info'
+        verbose: Nombre d'options -v (chacune abaisse d'un niveau)
+        quiet: Ne conserve que les avertissements et erreurs
+
+    Returns:
+        int: Niveau du module logging
+    """
+    if quiet:
+        return logging.WARNING
+
+    level = LOG_LEVELS.get((name or 'info').lower(), logging.INFO)
+    return max(logging.DEBUG, level - 10 * verbose)
+
+
+def setup_logging(level: int = logging.INFO, json_output: bool = False,
+                  log_file: Optional[str] = None, max_bytes: int = 1_000_000,
+                  backup_count: int = 5) -> logging.handlers.QueueListener:
+    """
+    Configure la journalisation de l'application.
+
+    Les enregistrements passent par une file (QueueHandler) et sont écrits
+    par un thread dédié, afin que la synchronisation ne bloque jamais sur les I/O.
+
+    Args:
+        level: Niveau de log minimal
+        json_output: Produit une ligne JSON par enregistrement
+        log_file: Fichier de log avec rotation (sinon sortie standard)
+        max_bytes: Taille maximale du fichier avant rotation
+        backup_count: Nombre de fichiers archivés conservés
+
+    Returns:
+        QueueListener: Le listener démarré (arrêté automatiquement à la sortie)
+    """
+    if json_output:
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('[%(asctime)s] %(levelname)s %(message)s', '%Y-%m-%d %H:%M:%S')
+
+    handlers: List[logging.Handler] = []
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        ))
+    else:
+        handlers.append(logging.StreamHandler())
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
@@ -0,0 +1,254 @@
+"""Fonctions utilitaires pour le profilage d'une synchronisation."""
+
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+import contextlib
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cprofile', 'sampling')
+PROFILE_PHASES = ('fetch', 'diff', 'write')
+
+
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage, sans dépendance externe.
+
+    Un thread relève périodiquement la pile de tous les autres threads ;
+    le résultat est exporté au format speedscope (https://www.speedscope.app).
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Initialise le profileur.
+
+        Args:
+            interval: Intervalle d'échantillonnage en secondes
+        """
+        self.interval = interval
+        self.active = False
+        self._frames: List[Dict] = []
+        self._frame_index: Dict[Tuple[str, str, int], int] = {}
+        self._samples: Dict[str, List[Tuple[List[int], float]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Démarre le thread d'échantillonnage."""
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Arrête le thread d'échantillonnage."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self) -> None:
+        """Boucle d'échantillonnage."""
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            if not self.active:
+                continue
+
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(self._frame_id(code.co_name, code.co_filename, frame.f_lineno))
+                    frame = frame.f_back
+                stack.reverse()
+                self._samples.setdefault(names.get(thread_id, str(thread_id)), []).append((stack, elapsed))
+
+    def _frame_id(self, name: str, filename: str, line: int) -> int:
+        """Retourne l'index d'une frame dans la table partagée."""
+        key = (name, filename, line)
+        if key not in self._frame_index:
+            self._frame_index[key] = len(self._frames)
+            self._frames.append({'name': name, 'file': filename, 'line': line})
+        return self._frame_index[key]
+
+    def to_speedscope(self, name: str) -> Dict:
+        """Exporte les échantillons au format speedscope (un profil par thread)."""
+        profiles = []
+        for thread_name, samples in self._samples.items():
+            weights = [w for _, w in samples]
+            profiles.append({
+                'type': 'sampled',
+                'name': thread_name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': [stack for stack, _ in samples],
+                'weights': weights,
+            })
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'exchange2calendar',
+            'shared': {'frames': self._frames},
+            'profiles': profiles,
+        }
+
+
+class SyncProfiler:
+    """
+    Profile une synchronisation, en totalité ou par phases (fetch, diff, write).
+
+    Produit, à partir du préfixe `output` :
+      - `<output>.prof` (cProfile, lisible par snakeviz) ou
+        `<output>.speedscope.json` (échantillonnage, lisible par speedscope) ;
+      - `<output>.summary.json` : durée des phases, pic mémoire et principaux
+        sites d'allocation (tracemalloc).
+    """
+
+    def __init__(self, output: str, mode: str = 'cprofile', phases: Optional[Sequence[str]] = None,
+                 memory_top: int = 10):
+        """
+        Initialise le profileur.
+
+        Args:
+            output: Préfixe des fichiers produits
+            mode: 'cprofile' (déterministe) ou 'sampling' (échantillonnage)
+            phases: Phases à profiler (toutes si vide)
+            memory_top: Nombre de sites d'allocation retenus
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Mode de profilage inconnu : {mode}")
+
+        self.output = output
+        self.mode = mode
+        self.phases = set(phases or ())
+        self.memory_top = memory_top
+        self.timings: Dict[str, float] = {}
+        self._profile = cProfile.Profile() if mode == 'cprofile' else None
+        self._sampler = SamplingProfiler() if mode == 'sampling' else None
+        self._active = False
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Démarre le profilage (immédiatement si aucune phase n'est ciblée)."""
+        tracemalloc.start()
+        if self._sampler:
+            self._sampler.start()
+        if not self.phases:
+            self._enable()
+
+    def stop(self) -> List[str]:
+        """Arrête le profilage, écrit les fichiers produits et retourne leurs chemins."""
+        self._disable()
+        if self._sampler:
+            self._sampler.stop()
+
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        top = snapshot.statistics('lineno')[:self.memory_top]
+        artifacts = []
+
+        if self._profile:
+            path = f"{self.output}.prof"
+            stats = pstats.Stats(self._profile)
+            for profile in self._thread_profiles:
+                stats.add(profile)
+            stats.dump_stats(path)
+            artifacts.append(path)
+        else:
+            path = f"{self.output}.speedscope.json"
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self._sampler.to_speedscope(self.output), f)
+            artifacts.append(path)
+
+        path = f"{self.output}.summary.json"
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'mode': self.mode,
+                'phases': sorted(self.phases) or list(PROFILE_PHASES),
+                'timings': self.timings,
+                'memory_peak_bytes': peak,
+                'memory_top': [{
+                    'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    'size_bytes': stat.size,
+                    'count': stat.count,
+                } for stat in top],
+            }, f, indent=2)
+        artifacts.append(path)
+
+        logger.info("⏱️ Profilage : %s | pic mémoire %.1f Mo | fichiers : %s",
+                    ', '.join(f"{k} {v:.2f}s" for k, v in self.timings.items()),
+                    peak / 1_000_000, ', '.join(artifacts),
+                    extra={'timings': self.timings, 'memory_peak_bytes': peak})
+        return artifacts
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Mesure une phase et la profile si elle est ciblée."""
+        targeted = name in self.phases
+        if targeted:
+            self._enable()
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+            if targeted:
+                self._disable()
+
+    @contextlib.contextmanager
+    def thread_profile(self) -> Iterator[None]:
+        """
+        Profile un thread de travail (cProfile ne suit que le thread qui l'active).
+
+        Le profil du thread est fusionné dans le fichier `.prof` à l'arrêt. Sans
+        effet en mode échantillonnage, qui relève déjà la pile de tous les threads.
+        """
+        profile = None
+        if self._profile and self._active:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ : un seul profileur actif, qui couvre alors tous les threads
+                profile = None
+
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+                with self._lock:
+                    self._thread_profiles.append(profile)
+
+    def _enable(self) -> None:
+        """Active la collecte."""
+        self._active = True
+        if self._profile:
+            self._profile.enable()
+        else:
+            self._sampler.active = True
+
+    def _disable(self) -> None:
+        """Suspend la collecte."""
+        self._active = False
+        if self._profile:
+            self._profile.disable()
+        else:
+            self._sampler.active = False
@@ -5,12 +5,23 @@ import pytz
 from unittest.mock import patch, MagicMock, mock_open
 import os
 import sys
+import json
+import logging
+import pstats
+import tempfile
+import threading
 
 # Import du module à tester
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 from src.exchange_service import clean_subject
-from src.google_service import get_exchange_uid
+from src.google_service import get_exchange_uid, make_google_event_id, is_quota_error
+from src.journal import SyncJournal
+from src.quota import QuotaBudget
+from src.synchronizer import CalendarSynchronizer
+from src.cassette import Cassette, ReplayExchangeService, ReplayGoogleService, ReplayedHttpError
 from src.utils.datetime_utils import normalize_str, to_utc_datetime, datetimes_equal, parse_google_start, to_py_datetime
+from src.utils.logging_utils import JsonFormatter, resolve_log_level
+from src.utils.profiling_utils import SyncProfiler
 
 class TestExchangeSync(unittest.TestCase):
 
@@ -125,5 +136,467 @@ class TestExchangeSync(unittest.TestCase):
         # Test avec type inconnu
         self.assertIsNone(to_py_datetime("2023-06-15"))
 
+    def test_resolve_log_level(self):
+        self.assertEqual(resolve_log_level(None), logging.INFO)
+        self.assertEqual(resolve_log_level("warning"), logging.WARNING)
+        self.assertEqual(resolve_log_level("info", verbose=1), logging.DEBUG)
+        self.assertEqual(resolve_log_level("info", verbose=5), logging.DEBUG)
+        self.assertEqual(resolve_log_level("debug", quiet=True), logging.WARNING)
+        self.assertEqual(resolve_log_level("inconnu"), logging.INFO)
+
+    def test_json_formatter(self):
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "%d créés", (3,), None)
+        record.created_count = 3
+        payload = json.loads(JsonFormatter().format(record))
+        self.assertEqual(payload['message'], "3 créés")
+        self.assertEqual(payload['level'], "INFO")
+        self.assertEqual(payload['created_count'], 3)
+        self.assertNotIn('args', payload)
+
+    def test_make_google_event_id(self):
+        event_id = make_google_event_id("AAMkAGI2=")
+        self.assertEqual(event_id, make_google_event_id("AAMkAGI2="))
+        self.assertNotEqual(event_id, make_google_event_id("AAMkAGI3="))
+        # Caractères base32hex uniquement (a-v, 0-9)
+        self.assertTrue(all(c in "0123456789abcdefghijklmnopqrstuv" for c in event_id))
+
+    def test_sync_journal_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = SyncJournal(os.path.join(tmp, "journal.jsonl"))
+            self.assertEqual(journal.pending("cal"), [])
+
+            journal.begin("cal", [{'action': 'insert', 'uid': 'a'}, {'action': 'delete', 'uid': 'b'},
+                                  {'action': 'insert', 'uid': 'c'}])
+            journal.record(0, 'done')
+            journal.record(1, 'error', 'boom')
+
+            # Seules les modifications jamais tentées sont reprises
+            pending = journal.pending("cal")
+            self.assertEqual([(m['index'], m['uid']) for m in pending], [(2, 'c')])
+
+            # Journal d'un autre calendrier : ignoré et supprimé
+            self.assertEqual(journal.pending("autre"), [])
+            self.assertFalse(os.path.exists(journal.path))
+
+            # Journal obsolète : ignoré
+            journal.begin("cal", [{'action': 'insert', 'uid': 'a'}])
+            journal.max_age = -1
+            self.assertEqual(journal.pending("cal"), [])
+
+    def test_cassette_anonymize(self):
+        cassette = Cassette("unused.json")
+        self.assertEqual(cassette.anonymize(" Réunion  équipe"), cassette.anonymize("Réunion équipe"))
+        self.assertNotEqual(cassette.anonymize("Réunion"), cassette.anonymize("Point"))
+        self.assertEqual(cassette.anonymize(""), "")
+        self.assertNotIn("alice", cassette.anonymize_email("alice@example.com"))
+
+        payload = cassette.anonymize_google_payload({
+            'items': [{'id': 'g1', 'summary': 'Réunion', 'creator': {'email': 'alice@example.com'}}]
+        })
+        self.assertEqual(payload['items'][0]['id'], 'g1')
+        self.assertEqual(payload['items'][0]['summary'], cassette.anonymize("Réunion"))
+        self.assertNotIn('creator', payload['items'][0])
+
+    def test_cassette_replay(self):
+        start = datetime(2023, 6, 15, 10, 0, tzinfo=timezone.utc)
+        cassette = Cassette("unused.json")
+        cassette.add('exchange.get_events', {}, [cassette.anonymize_exchange_event({
+            'uid': 'u1', 'subject': 'Réunion', 'location': '', 'body': '', 'organizer': '',
+            'start': start, 'end': start + timedelta(hours=1), 'all_day': False,
+        })])
+        cassette.add('events.list', {}, {'items': []})
+        cassette.add('events.insert', {}, error={'status': 409, 'message': 'HttpError'})
+
+        events = ReplayExchangeService(cassette, 'zero').get_events(start, start)
+        self.assertEqual(events[0]['start'], start)
+
+        google = ReplayGoogleService(cassette, 'zero')
+        self.assertEqual(google.events().list(calendarId='cal').execute(), {'items': []})
+        with self.assertRaises(ReplayedHttpError) as ctx:
+            google.events().insert(calendarId='cal', body={}).execute()
+        self.assertEqual(ctx.exception.resp.status, 409)
+
+        # Écriture absente de la cassette : réponse simulée
+        self.assertEqual(google.events().delete(calendarId='cal', eventId='g1').execute(), {'id': 'g1'})
+
+    def test_replay_pins_clock_to_recording(self):
+        recorded_at = datetime.now(timezone.utc) - timedelta(days=2)
+        gone_start = recorded_at + timedelta(days=1)
+
+        cassette = Cassette("unused.json")
+        cassette.add('exchange.get_events',
+                     {'start': recorded_at.isoformat(), 'end': (recorded_at + timedelta(days=10)).isoformat()}, [])
+        cassette.add('events.list', {}, {'items': [{
+            'id': 'g1', 'summary': 'anon-1', 'start': {'dateTime': gone_start.isoformat()},
+            'end': {'dateTime': (gone_start + timedelta(hours=1)).isoformat()},
+            'extendedProperties': {'private': {'exchange_uid': 'supprime'}},
+        }]})
+        self.assertEqual(cassette.recorded_now(), recorded_at)
+
+        # Rejoué deux jours plus tard, l'événement (désormais passé) est toujours supprimé
+        synchronizer = CalendarSynchronizer(ReplayExchangeService(cassette, 'zero'),
+                                            ReplayGoogleService(cassette, 'zero'), 'replay', 'Europe/Paris',
+                                            now=cassette.recorded_now)
+        self.assertEqual(synchronizer.synchronize(days_ahead=10), (0, 0, 1))
+
+    def test_fetch_events_concurrently(self):
+        google_started = threading.Event()
+
+        def get_events(start, end):
+            # Échoue si la lecture Google n'a pas démarré pendant la lecture Exchange
+            self.assertTrue(google_started.wait(timeout=5))
+            return [{'uid': 'u1'}]
+
+        def list_events(**kwargs):
+            google_started.set()
+            return MagicMock(execute=MagicMock(return_value={'items': [{'id': 'g1'}]}))
+
+        exchange_service = MagicMock(get_events=MagicMock(side_effect=get_events))
+        google_service = MagicMock()
+        google_service.events.return_value.list.side_effect = list_events
+
+        synchronizer = CalendarSynchronizer(exchange_service, google_service, 'cal', 'Europe/Paris')
+        start = datetime.now(timezone.utc)
+        outlook_events, google_events = synchronizer._fetch_events(start, start + timedelta(days=1))
+        self.assertEqual(outlook_events, [{'uid': 'u1'}])
+        self.assertEqual(google_events, [{'id': 'g1'}])
+
+        # Une erreur côté Google est remontée
+        google_service.events.return_value.list.side_effect = RuntimeError("quota")
+        google_started.set()
+        with self.assertRaises(RuntimeError):
+            synchronizer._fetch_events(start, start + timedelta(days=1))
+
+    def test_fetch_events_exchange_error_does_not_wait_for_google(self):
+        exchange_service = MagicMock(get_events=MagicMock(side_effect=RuntimeError("EWS indisponible")))
+        google_service = MagicMock()
+        synchronizer = CalendarSynchronizer(exchange_service, google_service, 'cal', 'Europe/Paris')
+        start = datetime.now(timezone.utc)
+
+        # Lecture Google bloquée : l'erreur Exchange est remontée sans l'attendre
+        release = threading.Event()
+        google_service.events.return_value.list.return_value.execute.side_effect = \
+            lambda: release.wait(timeout=5) and {'items': [], 'nextPageToken': 'page2'}
+        started = datetime.now()
+        with self.assertRaisesRegex(RuntimeError, "EWS indisponible"):
+            synchronizer._fetch_events(start, start + timedelta(days=1))
+        self.assertLess(datetime.now() - started, timedelta(seconds=1))
+        release.set()
+
+        # Une erreur Google concurrente est journalisée
+        google_failed = threading.Event()
+
+        def list_error():
+            google_failed.set()
+            raise RuntimeError("quota Google")
+
+        def get_events(start, end):
+            self.assertTrue(google_failed.wait(timeout=5))
+            raise RuntimeError("EWS indisponible")
+
+        google_service.events.return_value.list.return_value.execute.side_effect = list_error
+        exchange_service.get_events.side_effect = get_events
+        with self.assertLogs('src.synchronizer', level='ERROR') as logs:
+            with self.assertRaisesRegex(RuntimeError, "EWS indisponible"):
+                synchronizer._fetch_events(start, start + timedelta(days=1))
+            # L'erreur est journalisée dès que le thread Google se termine
+            deadline = datetime.now() + timedelta(seconds=5)
+            while not logs.records and datetime.now() < deadline:
+                threading.Event().wait(0.01)
+        self.assertIn("quota Google", logs.output[0])
+
+    def test_sync_profiler(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode, artifact in (('cprofile', '.prof'), ('sampling', '.speedscope.json')):
+                prefix = os.path.join(tmp, mode)
+                profiler = SyncProfiler(prefix, mode=mode, phases=['diff'])
+                profiler.start()
+                with profiler.phase('fetch'):
+                    pass
+                with profiler.phase('diff'):
+                    sorted(str(i) for i in range(10000))
+                artifacts = profiler.stop()
+
+                self.assertEqual(artifacts, [prefix + artifact, prefix + '.summary.json'])
+                with open(prefix + '.summary.json') as f:
+                    summary = json.load(f)
+                self.assertEqual(set(summary['timings']), {'fetch', 'diff'})
+                self.assertGreater(summary['memory_peak_bytes'], 0)
+
+        with self.assertRaises(ValueError):
+            SyncProfiler("unused", mode="inconnu")
+
+    def test_sync_profiler_merges_worker_threads(self):
+        def list_google_page():
+            return sorted(str(i) for i in range(1000))
+
+        def google_worker():
+            with profiler.thread_profile():
+                list_google_page()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = os.path.join(tmp, 'cprofile')
+            profiler = SyncProfiler(prefix, phases=['fetch'])
+            profiler.start()
+            with profiler.phase('fetch'):
+                worker = threading.Thread(target=google_worker)
+                worker.start()
+                worker.join()
+            profiler.stop()
+
+            functions = {name for _, _, name in pstats.Stats(prefix + '.prof').stats}
+            self.assertIn('list_google_page', functions)
+
+    def test_quota_budget(self):
+        self.assertIsNone(QuotaBudget().remaining())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, "quota.json")
+            budget = QuotaBudget(per_run=5, per_day=8, state_path=state_path)
+            budget.consume(4)
+            self.assertTrue(budget.allows())
+            self.assertFalse(budget.allows(2))
+            budget.save()
+
+            # Le compteur journalier est conservé d'une exécution à l'autre
+            budget = QuotaBudget(per_run=5, per_day=8, state_path=state_path)
+            self.assertEqual(budget.remaining(), 4)
+
+            budget.exhaust()
+            self.assertFalse(budget.allows())
+
+    def test_sync_skipped_when_budget_exhausted(self):
+        exchange_service = MagicMock()
+        exchange_service.get_events.return_value = []
+        google_service = MagicMock()
+        google_service.events.return_value.list.return_value.execute.return_value = {
+            'items': [], 'nextPageToken': 'page2'}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, "quota.json")
+
+            # Budget épuisé en cours de listage : exécution reportée, compteur enregistré
+            synchronizer = CalendarSynchronizer(exchange_service, google_service, 'cal', 'Europe/Paris',
+                                                budget=QuotaBudget(per_day=1, state_path=state_path))
+            with self.assertLogs('src.synchronizer', level='WARNING') as logs:
+                self.assertEqual(synchronizer.synchronize(days_ahead=10), (0, 0, 0))
+            self.assertIn("Budget de quota épuisé", logs.output[0])
+            self.assertEqual(google_service.events.return_value.list.call_count, 1)
+            with open(state_path) as f:
+                self.assertEqual(json.load(f)['used'], 1)
+
+            # Budget déjà épuisé : ni Exchange ni Google ne sont lus
+            synchronizer = CalendarSynchronizer(exchange_service, google_service, 'cal', 'Europe/Paris',
+                                                budget=QuotaBudget(per_day=1, state_path=state_path))
+            self.assertEqual(synchronizer.synchronize(days_ahead=10), (0, 0, 0))
+            self.assertEqual(exchange_service.get_events.call_count, 1)
+            self.assertEqual(google_service.events.return_value.list.call_count, 1)
+
+    def test_mutations_ordered_and_deferred(self):
+        now = datetime.now(timezone.utc)
+        events = [{
+            'uid': f'u{days}', 'subject': f'Réunion {days}', 'location': '', 'body': '', 'all_day': False,
+            'start': now + timedelta(days=days), 'end': now + timedelta(days=days, hours=1),
+        } for days in (5, 1, 3)]
+
+        google_service = MagicMock()
+        budget = QuotaBudget(per_run=2)
+        synchronizer = CalendarSynchronizer(MagicMock(), google_service, 'cal', 'Europe/Paris', budget=budget)
+
+        mutations = synchronizer._plan_mutations(events, {}, {ev['uid'] for ev in events})
+        self.assertEqual([m['uid'] for m in mutations], ['u1', 'u3', 'u5'])
+
+        counts = synchronizer._apply_mutations([dict(m, index=i) for i, m in enumerate(mutations)])
+        self.assertEqual(counts, (2, 0, 0))
+        self.assertEqual(synchronizer.deferred, 1)
+        inserted = [c.kwargs['body']['extendedProperties']['private']['exchange_uid']
+                    for c in google_service.events.return_value.insert.call_args_list]
+        self.assertEqual(inserted, ['u1', 'u3'])
+
+    def test_duplicate_reconciliation(self):
+        def event(event_id, uid, updated):
+            return {'id': event_id, 'updated': updated,
+                    'extendedProperties': {'private': {'exchange_uid': uid}}}
+
+        canonical_id = make_google_event_id('u1')
+        google_events = [
+            event('a', 'u1', '2024-01-01T00:00:00Z'),
+            event(canonical_id, 'u1', '2023-01-01T00:00:00Z'),
+            event('b', 'u1', '2025-01-01T00:00:00Z'),
+            event('c', 'u2', '2024-01-01T00:00:00Z'),
+            event('d', 'u2', '2025-01-01T00:00:00Z'),
+            {'id': 'perso1'}, {'id': 'perso2'},
+        ]
+
+        synchronizer = CalendarSynchronizer(MagicMock(), MagicMock(), 'cal', 'Europe/Paris')
+        google_index, duplicates = synchronizer._index_google_events(google_events)
+
+        # Identifiant déterministe en priorité, sinon la modification la plus récente
+        self.assertEqual(google_index['u1']['id'], canonical_id)
+        self.assertEqual(google_index['u2']['id'], 'd')
+        self.assertEqual(sorted(d['id'] for d in duplicates), ['a', 'b', 'c'])
+
+        class FakeBatch:
+            def __init__(self, callback):
+                self.callback, self.requests = callback, []
+
+            def add(self, request, callback=None, request_id=None):
+                self.requests.append(request_id)
+
+            def execute(self):
+                for request_id in self.requests:
+                    self.callback(request_id, '', None)
+
+        google_service = MagicMock()
+        google_service.new_batch_http_request.side_effect = FakeBatch
+        synchronizer = CalendarSynchronizer(MagicMock(), google_service, 'cal', 'Europe/Paris',
+                                            budget=QuotaBudget(per_run=2))
+        synchronizer._remove_duplicates(duplicates, batch_size=50)
+
+        # Le lot est réduit au budget restant, le reste est reporté
+        self.assertEqual(synchronizer.duplicates_removed, 2)
+        self.assertEqual(synchronizer.duplicates_deferred, 1)
+        self.assertEqual(synchronizer.deferred, 0)
+
+        synchronizer = CalendarSynchronizer(MagicMock(), google_service, 'cal', 'Europe/Paris')
+        synchronizer._remove_duplicates(duplicates, batch_size=2)
+        self.assertEqual(synchronizer.duplicates_removed, 3)
+        self.assertEqual(synchronizer.duplicates_deferred, 0)
+
+    def test_resume_does_not_loop_on_failing_mutation(self):
+        now = datetime.now(timezone.utc)
+
+        def event(uid, days):
+            return {'uid': uid, 'subject': uid, 'location': '', 'body': '', 'all_day': False,
+                    'start': now + timedelta(days=days), 'end': now + timedelta(days=days, hours=1)}
+
+        class Killed(BaseException):
+            """Simule l'arrêt brutal du processus (OOM, timeout cron)."""
+
+        outlook_events = [event('bad', 1), event('a', 2), event('b', 3)]
+        exchange_service = MagicMock()
+        exchange_service.get_events.side_effect = lambda start, end: list(outlook_events)
+
+        inserted = []
+        calendar = []
+        kills = ['a']
+
+        def insert(calendarId, body):
+            uid = body['extendedProperties']['private']['exchange_uid']
+            request = MagicMock()
+            if uid == 'bad':
+                request.execute.side_effect = RuntimeError("400 Bad Request")
+            elif uid in kills:
+                kills.remove(uid)
+                request.execute.side_effect = Killed()
+            else:
+                request.execute.side_effect = lambda: (inserted.append(uid), calendar.append(body))
+            return request
+
+        google_service = MagicMock()
+        google_service.events.return_value.list.return_value.execute.side_effect = \
+            lambda: {'items': list(calendar)}
+        google_service.events.return_value.insert.side_effect = insert
+
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = SyncJournal(os.path.join(tmp, "journal.jsonl"))
+            synchronizer = CalendarSynchronizer(exchange_service, google_service, 'cal', 'Europe/Paris',
+                                                journal=journal)
+
+            # 1re exécution : échec de 'bad', puis arrêt brutal pendant l'insertion de 'a'
+            with self.assertRaises(Killed):
+                synchronizer.synchronize(days_ahead=10)
+
+            # 2e exécution : reprise des seules modifications jamais tentées, sans relire Exchange
+            self.assertEqual(synchronizer.synchronize(days_ahead=10), (2, 0, 0))
+            self.assertEqual(exchange_service.get_events.call_count, 1)
+            self.assertFalse(os.path.exists(journal.path))
+
+            # 3e exécution : comparaison complète, l'échec persistant ne bloque pas les nouveautés
+            outlook_events.append(event('new1', 2))
+            with self.assertRaises(RuntimeError):
+                synchronizer.synchronize(days_ahead=10)
+
+            # 4e exécution : pas de reprise en boucle de 'bad'
+            with self.assertRaises(RuntimeError):
+                synchronizer.synchronize(days_ahead=10)
+
+        self.assertEqual(exchange_service.get_events.call_count, 3)
+        self.assertEqual(inserted, ['a', 'b', 'new1'])
+
+    def test_dry_run_does_not_touch_google(self):
+        now = datetime.now(timezone.utc)
+        exchange_service = MagicMock()
+        exchange_service.get_events.return_value = [{
+            'uid': 'u1', 'subject': 'Réunion', 'location': '', 'body': '', 'all_day': False,
+            'start': now + timedelta(days=1), 'end': now + timedelta(days=1, hours=1),
+        }]
+        google_service = MagicMock()
+
+        synchronizer = CalendarSynchronizer(exchange_service, google_service, 'cal', 'Europe/Paris')
+        self.assertEqual(synchronizer.synchronize(days_ahead=10, dry_run=True), (0, 0, 0))
+
+        # Seul Exchange est lu : aucune lecture ni écriture côté Google
+        exchange_service.get_events.assert_called_once()
+        google_service.events.assert_not_called()
+        google_service.new_batch_http_request.assert_not_called()
+
+    def test_insert_conflict_fallback_respects_budget(self):
+        conflict = RuntimeError("409 Conflict")
+        conflict.resp = MagicMock(status=409)
+
+        google_service = MagicMock()
+        google_service.events.return_value.insert.return_value.execute.side_effect = conflict
+
+        budget = QuotaBudget(per_run=1)
+        synchronizer = CalendarSynchronizer(MagicMock(), google_service, 'cal', 'Europe/Paris', budget=budget)
+        mutations = [{'action': 'insert', 'uid': 'u1', 'event_id': 'e1', 'summary': 'Réunion',
+                      'body': {}, 'index': 0}]
+
+        # L'insertion consomme le seul appel autorisé : la mise à jour de repli est reportée
+        self.assertEqual(synchronizer._apply_mutations(mutations), (0, 0, 0))
+        self.assertEqual(synchronizer.deferred, 1)
+        self.assertEqual(budget.run_used, 1)
+        google_service.events.return_value.update.assert_not_called()
+
+    def test_is_quota_error(self):
+        def http_error(status, reason=None):
+            error = Exception("HttpError")
+            error.resp = MagicMock(status=status)
+            error.error_details = [{'domain': 'usageLimits', 'reason': reason}] if reason else ''
+            return error
+
+        self.assertTrue(is_quota_error(http_error(429)))
+        self.assertTrue(is_quota_error(http_error(403, 'rateLimitExceeded')))
+        self.assertFalse(is_quota_error(http_error(403, 'forbidden')))
+        self.assertFalse(is_quota_error(http_error(403)))
+        self.assertFalse(is_quota_error(http_error(400, 'rateLimitExceeded')))
+        self.assertFalse(is_quota_error(RuntimeError("rateLimitExceeded")))
+
+        # Les motifs sont conservés par le rejeu d'une cassette
+        cassette = Cassette("unused.json")
+        cassette.add('events.insert', {}, error={'status': 403, 'message': 'HttpError',
+                                                 'reasons': ['userRateLimitExceeded']})
+        with self.assertRaises(ReplayedHttpError) as ctx:
+            ReplayGoogleService(cassette, 'zero').events().insert(calendarId='cal', body={}).execute()
+        self.assertTrue(is_quota_error(ctx.exception))
+
+    def test_fetch_google_events_follows_pages(self):
+        pages = {
+            None: {'items': [{'id': 'g1'}], 'nextPageToken': 'p2'},
+            'p2': {'items': [{'id': 'g2'}]},
+        }
+        google_service = MagicMock()
+        google_service.events.return_value.list.side_effect = \
+            lambda **kwargs: MagicMock(execute=MagicMock(return_value=pages[kwargs.get('pageToken')]))
+
+        budget = QuotaBudget()
+        synchronizer = CalendarSynchronizer(MagicMock(), google_service, 'cal', 'Europe/Paris', budget=budget)
+        start = datetime.now(timezone.utc)
+        google_events = synchronizer._fetch_google_events(start, start + timedelta(days=1))
+
+        self.assertEqual([e['id'] for e in google_events], ['g1', 'g2'])
+        self.assertEqual(budget.run_used, 2)
+
 if __name__ == '__main__':
     unittest.main()